@@ -0,0 +1,183 @@
+from typing import Dict, List, Any, Callable
+import re
+
+import numpy as np
+
+
+STOP_WORDS = {
+    'для', 'или', 'что', 'это', 'как', 'при', 'все', 'его', 'так', 'они', 'где', 'наш', 'нас', 'вас',
+    'the', 'and', 'for', 'with', 'are', 'you', 'our', 'from', 'this', 'that'
+}
+STEM_LENGTH = 5
+# Ссылки в стиле "referenced" от Jina: [1]: https://...
+LINK_REFERENCE = re.compile(r'^\s*\[\d+\]:\s*\S+.*$', re.MULTILINE)
+SENTENCE_END = re.compile(r'(?<=[.!?;])\s+|\n')
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов без обращения к API (около 3 символов на токен для кириллицы)"""
+    return len(text) // 3 + 1
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на термы: нижний регистр, без стоп-слов, усечение до общей основы"""
+    terms = []
+    for word in re.findall(r'\w+', text.lower()):
+        if len(word) < 3 or word.isdigit() or word in STOP_WORDS:
+            continue
+        terms.append(word[:STEM_LENGTH])
+    return terms
+
+
+def _split_long_block(block: str, max_chars: int) -> List[str]:
+    """Делит слишком длинный блок по предложениям, а их при необходимости — по длине"""
+    pieces, current = [], ''
+    for sentence in SENTENCE_END.split(block):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        while len(sentence) > max_chars:
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(md_text: str, max_chars: int = 600) -> List[str]:
+    """Делит markdown страницы (без секции Links/Buttons) на фрагменты по абзацам и заголовкам"""
+    content = LINK_REFERENCE.sub('', md_text or '')
+    blocks = [block.strip() for block in re.split(r'\n\s*\n', content) if block.strip()]
+    chunks, current = [], ''
+    for block in blocks:
+        pieces = [block] if len(block) <= max_chars else _split_long_block(block, max_chars)
+        for piece in pieces:
+            # Заголовок начинает новый фрагмент
+            if current and (piece.startswith('#') or len(current) + len(piece) + 2 > max_chars):
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def bm25_scores(documents: List[List[str]], queries: List[List[str]], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """Считает матрицу BM25 оценок (запросы x документы); словарь ограничен термами запросов"""
+    vocabulary: Dict[str, int] = {}
+    for query in queries:
+        for term in query:
+            vocabulary.setdefault(term, len(vocabulary))
+    scores = np.zeros((len(queries), len(documents)))
+    if not vocabulary or not documents:
+        return scores
+
+    # Матрица частот термов (документы x термы)
+    rows, cols = [], []
+    for doc_index, document in enumerate(documents):
+        for term in document:
+            term_index = vocabulary.get(term)
+            if term_index is not None:
+                rows.append(doc_index)
+                cols.append(term_index)
+    tf = np.zeros((len(documents), len(vocabulary)))
+    np.add.at(tf, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), 1)
+
+    doc_lengths = np.fromiter((len(document) for document in documents), dtype=float, count=len(documents))
+    avg_length = doc_lengths.mean() or 1.0
+    doc_freq = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((len(documents) - doc_freq + 0.5) / (doc_freq + 0.5))
+    length_norm = k1 * (1 - b + b * doc_lengths / avg_length)
+    weights = idf * tf * (k1 + 1) / (tf + length_norm[:, None])
+
+    query_matrix = np.zeros((len(queries), len(vocabulary)))
+    for query_index, query in enumerate(queries):
+        query_matrix[query_index, [vocabulary[term] for term in query]] = 1
+    return query_matrix @ weights.T
+
+
+def field_query(field_config: Dict[str, Any]) -> List[str]:
+    """Формирует запрос для поля из его имени и описания"""
+    return tokenize(f"{field_config.get('name', '').replace('_', ' ')} {field_config.get('description', '') or ''}")
+
+
+def _trim_to_budget(text: str, token_budget: int, count_tokens: Callable[[str], int]) -> str:
+    """Возвращает самое длинное начало текста, укладывающееся в бюджет (двоичный поиск по длине)"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def select_relevant_chunks(
+    md_text: str,
+    custom_fields: List[Dict[str, Any]],
+    token_budget: int,
+    max_chunk_chars: int = 600,
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> Dict[str, Any]:
+    """Собирает контекст для промпта из наиболее релевантных полям фрагментов в пределах бюджета токенов.
+
+    Фрагменты выбираются по очереди для каждого поля (лучший для каждого,
+    затем второй и т.д.), первый фрагмент страницы (заголовок, вводный текст)
+    сохраняется, если занимает не больше четверти бюджета. Оставшийся бюджет
+    заполняется фрагментами по суммарной оценке, а при равной — по порядку в
+    тексте. Если ни один фрагмент не помещается, лучший обрезается до бюджета,
+    так что для непустой страницы текст не бывает пустым (если в бюджет
+    помещается хотя бы один символ). Порядок фрагментов
+    в тексте не меняется. Возвращает словарь с ключами text, selected, total, tokens.
+    """
+    chunks = split_into_chunks(md_text, max_chunk_chars)
+    chunk_tokens = [count_tokens(chunk) for chunk in chunks]
+    if sum(chunk_tokens) <= token_budget or not custom_fields:
+        text = "\n\n".join(chunks) if chunks else md_text
+        return {"text": text, "selected": len(chunks), "total": len(chunks), "tokens": sum(chunk_tokens)}
+
+    scores = bm25_scores([tokenize(chunk) for chunk in chunks], [field_query(field) for field in custom_fields])
+    # Ранги фрагментов для каждого поля по убыванию оценки (стабильно по позиции в тексте)
+    rankings = np.argsort(-scores, axis=1, kind='stable')
+
+    selected = set()
+    used_tokens = 0
+    if chunk_tokens[0] <= token_budget // 4:
+        selected.add(0)
+        used_tokens = chunk_tokens[0]
+    for rank in range(len(chunks)):
+        for field_index in range(len(custom_fields)):
+            chunk_index = int(rankings[field_index, rank])
+            if scores[field_index, chunk_index] <= 0 or chunk_index in selected:
+                continue
+            if used_tokens + chunk_tokens[chunk_index] > token_budget:
+                continue
+            selected.add(chunk_index)
+            used_tokens += chunk_tokens[chunk_index]
+
+    # Формулировки на странице часто не совпадают с описаниями полей: добираем бюджет остальными фрагментами
+    for chunk_index in np.argsort(-scores.sum(axis=0), kind='stable'):
+        chunk_index = int(chunk_index)
+        if chunk_index not in selected and used_tokens + chunk_tokens[chunk_index] <= token_budget:
+            selected.add(chunk_index)
+            used_tokens += chunk_tokens[chunk_index]
+
+    if not selected:
+        best = int(np.argmax(scores.sum(axis=0)))
+        text = _trim_to_budget(chunks[best], token_budget, count_tokens)
+        return {"text": text, "selected": 1, "total": len(chunks), "tokens": count_tokens(text)}
+
+    ordered = sorted(selected)
+    return {
+        "text": "\n\n".join(chunks[index] for index in ordered),
+        "selected": len(ordered),
+        "total": len(chunks),
+        "tokens": used_tokens
+    }
@@ -0,0 +1,448 @@
+"""Нагрузочный стенд для цепочки Jina Reader -> YandexGPT.
+
+Поднимает локальные моки Jina Reader и YandexGPT с настраиваемыми
+распределениями задержек и долей ошибок, прогоняет через них реальные
+fetch_markdown/extract_description с нарастающей конкурентностью и
+записывает кривую масштабирования: пропускную способность, хвостовые
+задержки, загрузку CPU и RSS процесса.
+
+Пример:
+    python load_test.py --levels 1,4,16 --jina-latency lognormal:0.8,0.4 \\
+        --llm-latency lognormal:2,0.5 --time-scale 0.1 --output curve.json
+    python load_test.py --levels 1,4,16 --time-scale 0.1 --baseline curve.json
+"""
+from typing import Dict, List, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import random
+import sys
+import threading
+import time
+
+import requests
+
+from dynamic_models import DynamicModelGenerator, FieldConfigManager
+from pipeline import DEFAULT_SYSTEM_PROMPT, DEFAULT_USER_PROMPT, fetch_markdown, extract_description
+
+
+# --- Распределения задержек ---
+DISTRIBUTIONS = {
+    "fixed": 1,      # fixed:секунды
+    "uniform": 2,    # uniform:мин,макс
+    "exp": 1,        # exp:среднее
+    "lognormal": 2   # lognormal:медиана,sigma
+}
+
+
+def parse_distribution(spec: str) -> Tuple[str, List[float]]:
+    """Разбирает описание распределения вида "lognormal:0.8,0.4" """
+    name, _, raw_params = spec.partition(':')
+    name = name.strip().lower()
+    if name not in DISTRIBUTIONS:
+        raise argparse.ArgumentTypeError(f"Неизвестное распределение: {name}")
+    try:
+        params = [float(value) for value in raw_params.split(',') if value.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Некорректные параметры распределения: {spec}")
+    if len(params) != DISTRIBUTIONS[name]:
+        raise argparse.ArgumentTypeError(f"Распределение {name} ожидает {DISTRIBUTIONS[name]} параметр(а)")
+    return name, params
+
+
+def sample_latency(distribution: Tuple[str, List[float]], rng: random.Random) -> float:
+    """Возвращает случайную задержку в секундах"""
+    name, params = distribution
+    if name == "fixed":
+        return max(0.0, params[0])
+    if name == "uniform":
+        return rng.uniform(params[0], params[1])
+    if name == "exp":
+        return rng.expovariate(1.0 / params[0]) if params[0] > 0 else 0.0
+    return rng.lognormvariate(math.log(params[0]), params[1]) if params[0] > 0 else 0.0
+
+
+def request_rng(seed: int, prefix: str, key: str) -> random.Random:
+    """Генератор случайных чисел для одного запроса, определяемый сидом и содержимым запроса"""
+    digest = hashlib.sha256(f"{seed}:{prefix}:{key}".encode('utf-8')).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+# --- Моки внешних сервисов ---
+def build_mock_page(url: str, page_kb: int) -> str:
+    """Генерирует markdown страницы в формате Jina Reader (с секцией Links/Buttons)"""
+    paragraph = (
+        f"Компания {url} занимается поставками промышленного оборудования и оказывает услуги "
+        "по монтажу, пусконаладке и сервисному обслуживанию. Работаем по всей России. "
+        "Телефон: +7 495 000 00 00, email: info@example.ru.\n\n"
+    )
+    repeats = max(1, (page_kb * 1024) // len(paragraph.encode('utf-8')))
+    body = f"Title: {url}\n\nURL Source: {url}\n\nMarkdown Content:\n" + paragraph * repeats
+    links = (
+        "Links/Buttons:\n"
+        f"- [Главная]({url})\n"
+        f"- [О компании]({url.rstrip('/')}/about)\n"
+        f"- [Контакты]({url.rstrip('/')}/contacts)\n"
+    )
+    return body + links
+
+
+def build_mock_answer(fields_config: List[Dict[str, Any]]) -> str:
+    """Генерирует корректный JSON ответ модели для заданной схемы полей"""
+    samples = {
+        "text": "Пример значения",
+        "number": 1.5,
+        "integer": 1,
+        "boolean": True,
+        "list": ["элемент 1", "элемент 2"],
+        "dict": {"ключ": "значение"}
+    }
+    answer = {field["name"]: samples.get(field["type"], "") for field in fields_config}
+    return json.dumps(answer, ensure_ascii=False, indent=2)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Обработчик моков: POST /jina имитирует Jina Reader, POST /llm имитирует YandexGPT"""
+
+    config: Dict[str, Any] = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _draw(self, prefix: str, key: str) -> Tuple[float, bool]:
+        # Задержка и ошибка зависят только от (seed, запрос), а не от порядка запросов между потоками,
+        # поэтому повторный прогон с той же конфигурацией дает те же задержки
+        rng = request_rng(self.config["seed"], prefix, key)
+        latency = sample_latency(self.config[f"{prefix}_latency"], rng) * self.config["time_scale"]
+        failed = rng.random() < self.config[f"{prefix}_error_rate"]
+        return latency, failed
+
+    def _reply(self, status: int, body: str, content_type: str):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        request = json.loads(body or b"{}")
+        if self.path == "/jina":
+            latency, failed = self._draw("jina", request.get("url", ""))
+            time.sleep(latency)
+            if failed:
+                self._reply(503, "Service Unavailable", "text/plain")
+            else:
+                self._reply(200, build_mock_page(request.get("url", ""), self.config["page_kb"]), "text/plain; charset=utf-8")
+        elif self.path == "/llm":
+            latency, failed = self._draw("llm", body.decode('utf-8'))
+            time.sleep(latency)
+            if failed:
+                self._reply(503, json.dumps({"error": "Service Unavailable"}), "application/json")
+            else:
+                self._reply(200, json.dumps({"text": self.config["answer"]}, ensure_ascii=False), "application/json")
+        else:
+            self._reply(404, "Not Found", "text/plain")
+
+
+def _serve_mocks(config: Dict[str, Any], port_queue):
+    """Запускает сервер моков (в отдельном процессе, чтобы не искажать CPU/RSS замеры)"""
+    MockHandler.config = config
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class MockYandexGPTModel:
+    """Клиент мока YandexGPT с интерфейсом модели из yandex_cloud_ml_sdk (configure/run/tokenize)"""
+
+    def __init__(self, url: str, timeout: float = 60, temperature: Optional[float] = None):
+        self.url = url
+        self.timeout = timeout
+        self.temperature = temperature
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def configure(self, temperature: Optional[float] = None, **kwargs):
+        configured = MockYandexGPTModel(self.url, self.timeout, temperature)
+        configured._local = self._local
+        return configured
+
+    def run(self, messages: List[Dict[str, str]]):
+        resp = self._session().post(
+            self.url,
+            json={"messages": messages, "temperature": self.temperature},
+            timeout=self.timeout
+        )
+        resp.raise_for_status()
+        return [SimpleNamespace(text=resp.json()["text"])]
+
+    def tokenize(self, text: str) -> List[str]:
+        return text.split()
+
+
+# --- Замеры ресурсов ---
+def current_rss_mb() -> float:
+    """Возвращает текущий RSS процесса в МБ"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # На macOS ru_maxrss в байтах, на Linux в килобайтах
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class RssSampler:
+    """Фоновый поток, фиксирующий пиковый RSS за время уровня нагрузки"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+# --- Прогон нагрузки ---
+def run_job(job_id: int, args, jina_url: str, model: MockYandexGPTModel, fields_config: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Одна задача: batch_size сайтов через fetch -> extract, как при нажатии кнопок в UI"""
+    local = run_job.local
+    if not hasattr(local, "session"):
+        # Как и в Streamlit, у каждой сессии (потока) свой генератор моделей
+        local.session = requests.Session()
+        local.model_generator = DynamicModelGenerator()
+    timings = {"fetch": 0.0, "llm": 0.0}
+    start = time.perf_counter()
+    stage = "fetch"
+    try:
+        for i in range(args.batch_size):
+            site = f"https://site-{job_id}-{i}.example.ru/"
+            stage = "fetch"
+            stage_start = time.perf_counter()
+            md_text, _, _ = fetch_markdown(site, find_about=args.find_about, reader_url=jina_url, session=local.session)
+            timings["fetch"] += time.perf_counter() - stage_start
+            stage = "llm"
+            stage_start = time.perf_counter()
+            extraction = extract_description(
+                model, DEFAULT_SYSTEM_PROMPT, DEFAULT_USER_PROMPT, md_text, fields_config, local.model_generator,
+                token_budget=args.token_budget
+            )
+            timings["llm"] += time.perf_counter() - stage_start
+            if extraction["parse_error"]:
+                stage = "parse"
+                raise ValueError("Ответ модели не разобран")
+        return {"ok": True, "latency": time.perf_counter() - start, **timings}
+    except Exception:
+        return {"ok": False, "stage": stage, "latency": time.perf_counter() - start, **timings}
+
+
+run_job.local = threading.local()
+
+
+def run_level(concurrency: int, args, jina_url: str, model: MockYandexGPTModel, fields_config: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Прогоняет concurrency * jobs_per_worker задач с заданной конкурентностью"""
+    jobs = concurrency * args.jobs_per_worker
+    cpu_before = time.process_time()
+    wall_start = time.perf_counter()
+    with RssSampler() as rss:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(lambda job_id: run_job(job_id, args, jina_url, model, fields_config), range(jobs)))
+    wall = time.perf_counter() - wall_start
+    cpu_seconds = time.process_time() - cpu_before
+
+    ok = [outcome for outcome in outcomes if outcome["ok"]]
+    errors: Dict[str, int] = {}
+    for outcome in outcomes:
+        if not outcome["ok"]:
+            errors[outcome["stage"]] = errors.get(outcome["stage"], 0) + 1
+    latencies = [outcome["latency"] for outcome in ok]
+    return {
+        "concurrency": concurrency,
+        "jobs": jobs,
+        "ok": len(ok),
+        "errors": errors,
+        "wall_s": wall,
+        "throughput": len(ok) / wall if wall > 0 else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "max_s": max(latencies) if latencies else None,
+        "fetch_p95_s": percentile([outcome["fetch"] for outcome in ok], 95),
+        "llm_p95_s": percentile([outcome["llm"] for outcome in ok], 95),
+        "cpu_percent": 100 * cpu_seconds / wall if wall > 0 else 0.0,
+        "cpu_ms_per_job": 1000 * cpu_seconds / jobs if jobs else 0.0,
+        "rss_peak_mb": rss.peak
+    }
+
+
+# Абсолютный порог изменений, ниже которого отличие считается шумом замера
+NOISE_FLOOR = {"p95_s": 0.005, "p99_s": 0.005, "cpu_ms_per_job": 2.0}
+
+
+def compare_with_baseline(levels: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Сравнивает кривую с эталонной и возвращает список регрессий"""
+    regressions = []
+    baseline_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in levels:
+        base = baseline_levels.get(level["concurrency"])
+        if not base:
+            continue
+        name = f"concurrency={level['concurrency']}"
+        if base["throughput"] and level["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {level['throughput']:.2f} < {base['throughput']:.2f}")
+        for key, floor in NOISE_FLOOR.items():
+            if not base.get(key) or level.get(key) is None:
+                continue
+            if level[key] > base[key] * (1 + tolerance) and level[key] - base[key] > floor:
+                regressions.append(f"{name}: {key} {level[key]:.3f} > {base[key]:.3f}")
+    return regressions
+
+
+def config_mismatches(config: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Возвращает параметры нагрузки и моков, которые отличаются от эталона (уровни конкурентности не учитываются)"""
+    # Приводим к виду после JSON, чтобы кортежи распределений сравнивались со списками из файла
+    config = json.loads(json.dumps(config))
+    baseline_config = baseline.get("config", {})
+    return [key for key, value in config.items() if key != "levels" and baseline_config.get(key) != value]
+
+
+def format_table(levels: List[Dict[str, Any]]) -> str:
+    """Форматирует результаты уровней в текстовую таблицу"""
+    def fmt(value):
+        return "-" if value is None else f"{value:.3f}"
+    header = f"{'conc':>5} {'jobs':>6} {'ok':>6} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'cpu%':>7} {'cpu ms/job':>11} {'rss MB':>8}"
+    lines = [header]
+    for level in levels:
+        lines.append(
+            f"{level['concurrency']:>5} {level['jobs']:>6} {level['ok']:>6} {sum(level['errors'].values()):>5} "
+            f"{level['throughput']:>8.2f} {fmt(level['p50_s']):>8} {fmt(level['p95_s']):>8} {fmt(level['p99_s']):>8} "
+            f"{level['cpu_percent']:>7.1f} {level['cpu_ms_per_job']:>11.2f} {level['rss_peak_mb']:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест цепочки Jina Reader -> YandexGPT на локальных моках")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="Уровни конкурентности через запятую")
+    parser.add_argument("--jobs-per-worker", type=int, default=20, help="Число задач на одного воркера на каждом уровне")
+    parser.add_argument("--batch-size", type=int, default=1, help="Сайтов в одной задаче (1 — пользователь, >1 — пакетная задача)")
+    parser.add_argument("--find-about", action="store_true", help="Искать страницу \"О компании\" (второй запрос к Jina)")
+    parser.add_argument("--jina-latency", type=parse_distribution, default=parse_distribution("lognormal:0.8,0.4"))
+    parser.add_argument("--jina-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=parse_distribution, default=parse_distribution("lognormal:2.0,0.5"))
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--token-budget", type=int, help="Бюджет токенов для отбора релевантных фрагментов страницы")
+    parser.add_argument("--page-kb", type=int, default=20, help="Размер markdown страницы от мока Jina, КБ")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Множитель задержек моков (например 0.1 для быстрого прогона)")
+    parser.add_argument("--warmup", type=int, default=3, help="Число задач прогрева перед замерами")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Путь для сохранения кривой масштабирования в JSON")
+    parser.add_argument("--baseline", help="Эталонная кривая JSON для поиска регрессий (код выхода 1 — регрессии, 2 — другие параметры)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимое ухудшение относительно эталона (доля)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    levels = [int(level) for level in args.levels.split(',') if level.strip()]
+    fields_config = FieldConfigManager().default_fields
+
+    mock_config = {
+        "jina_latency": args.jina_latency,
+        "jina_error_rate": args.jina_error_rate,
+        "llm_latency": args.llm_latency,
+        "llm_error_rate": args.llm_error_rate,
+        "page_kb": args.page_kb,
+        "time_scale": args.time_scale,
+        "seed": args.seed,
+        "answer": build_mock_answer(fields_config)
+    }
+    port_queue = multiprocessing.Queue()
+    mock_process = multiprocessing.Process(target=_serve_mocks, args=(mock_config, port_queue), daemon=True)
+    mock_process.start()
+    try:
+        port = port_queue.get(timeout=10)
+        jina_url = f"http://127.0.0.1:{port}/jina"
+        model = MockYandexGPTModel(f"http://127.0.0.1:{port}/llm")
+
+        # Прогрев: первые задачи платят за импорты, создание сессий и моделей
+        for job_id in range(args.warmup):
+            run_job(-1 - job_id, args, jina_url, model, fields_config)
+
+        results = []
+        print(format_table([]), flush=True)
+        for concurrency in levels:
+            level = run_level(concurrency, args, jina_url, model, fields_config)
+            results.append(level)
+            print(format_table([level]).splitlines()[-1], flush=True)
+    finally:
+        mock_process.terminate()
+        mock_process.join()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "tolerance")}
+    report = {"config": config, "levels": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        # Кривые сравнимы только при одинаковых параметрах нагрузки и моков
+        changed = config_mismatches(config, baseline)
+        if changed:
+            print(f"\nПараметры отличаются от эталона, сравнение невозможно: {', '.join(changed)}")
+            return 2
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\nРегрессии относительно эталона:")
+            for regression in regressions:
+                print(f"- {regression}")
+            return 1
+        print("\nРегрессий относительно эталона не обнаружено")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
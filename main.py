@@ -1,9 +1,6 @@
 import streamlit as st
 import pandas as pd
-import requests
 import random
-import time
-import re
 import json
 import markdown
 
@@ -12,22 +9,11 @@ from yandex_cloud_ml_sdk import YCloudML
 from yandex_cloud_ml_sdk.auth import IAMTokenAuth
 
 from dynamic_models import DynamicModelGenerator, FieldConfigManager
+from results_store import ResultsStore, schema_fingerprint, prompt_fingerprint
+from refresh import content_fingerprint
+from pipeline import DEFAULT_SYSTEM_PROMPT, DEFAULT_USER_PROMPT, find_about_links, fetch_markdown, extract_description
 
 
-# --- Функция для поиска "О компании" страниц ---
-def find_about_links(md_links_section):
-    # Ищем строки вида: - [caption](url)
-    pattern = re.compile(r'- \[(.*?)\]\((.*?)\)', re.IGNORECASE)
-    about_keywords = [
-        'о компании', 'о нас', 'about', 'about us', 'about-company', 'aboutus', 'about_company', 'aboutus', 'about.html', 'about.php', 'about.aspx', 'aboutus.html', 'aboutus.php', 'aboutus.aspx'
-    ]
-    results = []
-    for match in pattern.finditer(md_links_section):
-        caption, url = match.group(1).strip().lower(), match.group(2).strip().lower()
-        if any(kw in caption for kw in about_keywords) or any(kw in url for kw in about_keywords):
-            results.append({'caption': match.group(1), 'url': match.group(2)})
-    return results
-
 def main():
     st.set_page_config(page_title="Генератор описаний поставщика", layout="wide", page_icon="🤖")
 
@@ -40,6 +26,8 @@ def main():
         st.session_state['custom_fields'] = st.session_state['field_manager'].default_fields.copy()
     if 'parsed_result' not in st.session_state:
         st.session_state['parsed_result'] = None
+    if 'results_store' not in st.session_state:
+        st.session_state['results_store'] = ResultsStore()
 
     # --- Функции для работы с полями ---
     def remove_field(index: int):
@@ -53,6 +41,69 @@ def main():
         st.session_state['custom_fields'] = st.session_state['field_manager'].default_fields.copy()
         st.rerun()
 
+    # --- Функции для работы с хранилищем результатов ---
+    def load_stored_result(site_url: str) -> bool:
+        """Показывает последний сохраненный результат для сайта под текущей схемой полей"""
+        # Результат должен быть получен с текущими промптами и настройкой отбора фрагментов
+        token_budget = int(st.session_state.get('token_budget_input', 4000)) if st.session_state.get('chunk_selection_checkbox') else None
+        prompt_fp = prompt_fingerprint(
+            st.session_state.get('system_prompt', DEFAULT_SYSTEM_PROMPT),
+            st.session_state.get('user_prompt', DEFAULT_USER_PROMPT)
+        )
+        stored = st.session_state['results_store'].get_latest(
+            site_url, schema_fingerprint(st.session_state['custom_fields']), token_budget=token_budget, prompt_fp=prompt_fp
+        )
+        if not stored:
+            # Сбрасываем страницу и ответ предыдущего сайта, чтобы не приписать их новому
+            st.session_state['jina_md'] = ''
+            st.session_state['jina_site'] = ''
+            st.session_state['jina_time'] = None
+            st.session_state['about_found'] = False
+            st.session_state['gpt_resp'] = ''
+            st.session_state['structured_description'] = ''
+            st.session_state['parsed_result'] = None
+            st.session_state['yandex_time'] = None
+            st.session_state['stored_result_at'] = None
+            st.session_state['context_info'] = None
+            return False
+        st.session_state['jina_md'] = stored['markdown']
+        st.session_state['jina_site'] = stored['url']
+        st.session_state['jina_time'] = stored['fetch_time']
+        st.session_state['about_found'] = False
+        st.session_state['gpt_resp'] = stored['raw_response'] or ''
+        st.session_state['structured_description'] = stored['structured_description'] or ''
+        st.session_state['yandex_time'] = stored['llm_time']
+        st.session_state['stored_result_at'] = stored['created_at']
+        st.session_state['context_info'] = None
+        return True
+
+    def on_site_input_change():
+        """Показывает сохраненный результат для введенного вручную URL"""
+        site_url = st.session_state.get('site_input', '').strip()
+        if site_url:
+            load_stored_result(site_url)
+
+    def save_result(site_url: str, result_data, gpt_text: str, structured_text: str, token_budget, prompt_fp: str):
+        """Сохраняет результат извлечения в хранилище"""
+        try:
+            st.session_state['results_store'].save_result(
+                url=site_url,
+                markdown=st.session_state.get('jina_md', ''),
+                fields_config=st.session_state['custom_fields'],
+                result=result_data,
+                raw_response=gpt_text,
+                structured_description=structured_text,
+                model=YC_MODEL_NAME,
+                fetch_time=st.session_state.get('jina_time'),
+                llm_time=st.session_state.get('yandex_time'),
+                fingerprint=content_fingerprint(st.session_state.get('jina_md', '')),
+                token_budget=token_budget,
+                prompt_fp=prompt_fp
+            )
+            st.session_state['stored_result_at'] = None
+        except Exception as e:
+            st.warning(f"Не удалось сохранить результат: {e}")
+
     # --- Загрузка данных ---
     df = pd.read_csv('df_Company.csv')
     filled_site = df['Site'].notna().sum()
@@ -64,6 +115,9 @@ def main():
         st.session_state['site_input'] = ''
     if 'jina_md' not in st.session_state:
         st.session_state['jina_md'] = ''
+    if 'jina_site' not in st.session_state:
+        # URL, для которого получен текущий markdown
+        st.session_state['jina_site'] = ''
     if 'gpt_resp' not in st.session_state:
         st.session_state['gpt_resp'] = ''
     if 'last_dropdown_site' not in st.session_state:
@@ -72,22 +126,8 @@ def main():
         st.session_state['structured_description'] = ''
 
     # --- Нижний ряд: Промпты, поля модели и ответ YandexGPT ---
-    def_sys = "Ты — эксперт по анализу компаний и извлечению структурированной информации. Твоя задача - проанализировать информацию о компании и заполнить все необходимые поля в JSON формате согласно заданной схеме."
-    def_user = """Проанализируй информацию о компании и заполни все поля согласно схеме.
-
-        Информация о компании:
-        {desc}
-
-        ВАЖНО:
-        1. Заполни ВСЕ обязательные поля (required: true)
-        2. Для опциональных полей используй null если информация недоступна
-        3. Используй точные данные из текста
-        4. Для числовых полей используй только числа (без текста)
-        5. Для булевых полей используй true/false
-        6. Для списков используй массив: [\"item1\", \"item2\"], либо пустой массив [].
-        7. Для словарей используй объект: {{\"key\": \"value\"}}
-
-        Отвечай ТОЛЬКО JSON объектом с данными. Придерживайся схемы данных, даже если какое-то значение не найдено."""
+    def_sys = DEFAULT_SYSTEM_PROMPT
+    def_user = DEFAULT_USER_PROMPT
     # --- Основной интерфейс ---
     col1, col2 = st.columns([1, 1])
 
@@ -95,10 +135,11 @@ def main():
     with col1:
         # Настройки YandexGPT
         YC_FOLDER_ID = 'b1g1u3uo289nf62q3n08'
+        YC_MODEL_NAME = 'yandexgpt-lite'
         YC_IAM_TOKEN = st.text_input('Токен YandexGPT', value='', type='password')
         if YC_IAM_TOKEN:
             sdk = YCloudML(folder_id=YC_FOLDER_ID.strip(), auth=IAMTokenAuth(YC_IAM_TOKEN.strip()))
-            model = sdk.models.completions("yandexgpt-lite")
+            model = sdk.models.completions(YC_MODEL_NAME)
         else:
             model = None
 
@@ -131,62 +172,37 @@ def main():
             selected_site = selected_option.split('|', 1)[1].strip()
             if (not st.session_state['site_input']) or (st.session_state['site_input'] == st.session_state['last_dropdown_site']):
                 st.session_state['site_input'] = selected_site
+            # При выборе нового сайта сразу показываем сохраненный результат, если он есть
+            if selected_site != st.session_state['last_dropdown_site']:
+                load_stored_result(selected_site)
             st.session_state['last_dropdown_site'] = selected_site
         else:
             st.session_state['last_dropdown_site'] = ''
-        site = st.text_input('URL сайта', key='site_input')
+        site = st.text_input('URL сайта', key='site_input', on_change=on_site_input_change)
         about_checkbox = st.checkbox('Искать "О компании"', key='about_checkbox')
         md_button = st.button('В Markdown', type='primary', icon=':material/subdirectory_arrow_right:', key='markdown_button')
 
     # --- Логика для обычного Markdown ---
     if md_button:
         if site:
-            headers = {
-                "Content-Type": "application/json",
-                "X-Engine": "direct",
-                "X-Md-Link-Style": "referenced",
-                "X-Retain-Images": "none",
-                "X-With-Links-Summary": "all"
-            }
-            data = {"url": site}
             try:
-                start_time = time.perf_counter()
-                resp = requests.post("https://r.jina.ai/", headers=headers, json=data, timeout=10)
-                resp.raise_for_status()
-                md_text = resp.text
-                elapsed = time.perf_counter() - start_time
-
-                about_found = False
-                # --- Check for about page if checkbox is active ---
-                if about_checkbox:
-                    links_phrase = 'Links/Buttons:'
-                    if links_phrase in md_text:
-                        md_links_section = md_text.split(links_phrase, 1)[1]
-                    else:
-                        md_links_section = ''
-                    about_links = find_about_links(md_links_section)
-                    if about_links:
-                        # Fetch about page markdown
-                        about_url = about_links[0]['url']
-                        about_data = {"url": about_url}
-                        about_start = time.perf_counter()
-                        about_resp = requests.post("https://r.jina.ai/", headers=headers, json=about_data, timeout=10)
-                        about_resp.raise_for_status()
-                        md_text = about_resp.text
-                        elapsed = time.perf_counter() - about_start  # Optionally, use about page timing
-                        about_found = True
-
+                md_text, elapsed, about_found = fetch_markdown(site, find_about=about_checkbox)
                 st.session_state['jina_md'] = md_text
+                st.session_state['jina_site'] = site
                 st.session_state['jina_time'] = elapsed
                 st.session_state['about_found'] = about_found
+                st.session_state['stored_result_at'] = None
+                st.session_state['context_info'] = None
                 st.rerun()
             except Exception as e:
                 st.session_state['jina_md'] = f"Ошибка: {e}"
+                st.session_state['jina_site'] = ''
                 st.session_state['jina_time'] = None
                 st.session_state['about_found'] = False
                 st.rerun()
         else:
             st.session_state['jina_md'] = 'Пожалуйста, введите URL сайта.'
+            st.session_state['jina_site'] = ''
             st.session_state['jina_time'] = None
             st.session_state['about_found'] = False
             st.rerun()
@@ -211,7 +227,12 @@ def main():
         else:
             md_clean = md_text
         if md_clean and model:
-            tokens_count = len(model.tokenize(md_text))
+            # С отбором фрагментов в модель уходит только выбранный контекст, а не вся страница
+            context_info = st.session_state.get('context_info')
+            if context_info and st.session_state.get('chunk_selection_checkbox'):
+                tokens_count = len(model.tokenize(context_info['text']))
+            else:
+                tokens_count = len(model.tokenize(md_text))
             col_timer, col_tokens, col_ygpt, col_qwen = st.columns([0.15, 0.2, 0.2, 0.45], gap='small')
             with col_timer:
                 if jina_time is not None:
@@ -351,85 +372,77 @@ def main():
                             st.session_state['show_add_field'] = False
                             st.rerun()
 
+            # Отбор релевантных полям фрагментов страницы
+            ccol_toggle, ccol_budget = st.columns([0.6, 0.4])
+            with ccol_toggle:
+                chunk_selection = st.checkbox(
+                    'Только релевантные фрагменты',
+                    key='chunk_selection_checkbox',
+                    help='Отправлять в модель только фрагменты страницы, наиболее подходящие описаниям полей'
+                )
+            with ccol_budget:
+                token_budget = st.number_input(
+                    'Бюджет токенов',
+                    min_value=500,
+                    max_value=32000,
+                    value=4000,
+                    step=500,
+                    key='token_budget_input',
+                    disabled=not chunk_selection,
+                    label_visibility='collapsed'
+                )
+
             # Кнопка "В описание"
             if st.button('В описание', type='primary', icon=':material/subdirectory_arrow_right:', key='description_button'):
                 error_msg = None
                 gpt_text = ''
                 desc = st.session_state.get('jina_md', '')
+                jina_site = st.session_state.get('jina_site', '')
                 if not site:
                     error_msg = 'Пожалуйста, введите URL сайта.'
-                elif not desc or desc.startswith('Ошибка') or desc.startswith('Пожалуйста'):
+                elif not jina_site or not desc or desc.startswith('Ошибка') or desc.startswith('Пожалуйста'):
                     error_msg = 'Нет валидного описания сайта для отправки в YandexGPT.'
                 else:
                     try:
                         sys_prompt = st.session_state.get('system_prompt', def_sys)
                         user_prompt = st.session_state.get('user_prompt', def_user)
-                        user_prompt_filled = user_prompt.replace('{desc}', desc)
-                        if st.session_state['custom_fields']:
-                            model_class = st.session_state['model_generator'].create_dynamic_model(
-                                st.session_state['custom_fields'], 
-                                "DynamicCompanyDescription"
-                            )
-                            parser = st.session_state['model_generator'].create_parser(model_class)
-                            format_instructions = parser.get_format_instructions()
-                            field_names = [field['name'] for field in st.session_state['custom_fields']]
-                            field_descriptions = [field.get('description', '') for field in st.session_state['custom_fields']]
-                            field_instructions = "\n\nПроанализируй информацию о компании и заполни следующие поля в JSON формате:\n"
-                            for i, (name, desc) in enumerate(zip(field_names, field_descriptions)):
-                                if desc:
-                                    field_instructions += f"- {name}: {desc}\n"
-                                else:
-                                    field_instructions += f"- {name}\n"
-                            enhanced_prompt = f"{user_prompt_filled}\n{field_instructions}\n\n{format_instructions}"
-                            start_time = time.perf_counter()
-                            result = model.configure(temperature=0.7).run([
-                                {"role": "system", "text": sys_prompt},
-                                {"role": "user", "text": enhanced_prompt}
-                            ])
-                            elapsed = time.perf_counter() - start_time
-                            st.session_state['yandex_time'] = elapsed
-                            gpt_text = result[0].text if result and hasattr(result[0], 'text') else str(result)
-                            parsed_result = st.session_state['model_generator'].parse_llm_response(gpt_text, model_class)
-                            if parsed_result:
-                                st.session_state['parsed_result'] = parsed_result
-                                st.session_state['gpt_resp'] = gpt_text
-                                result_data = parsed_result.model_dump()
-                                structured_text = ""
-                                for field_name, field_value in result_data.items():
-                                    if field_value is not None and field_value != "":
-                                        field_config = next((field for field in st.session_state['custom_fields'] if field['name'] == field_name), None)
-                                        display_name = field_config['description'] if field_config else field_name.replace('_', ' ').title()
-                                        if isinstance(field_value, list):
-                                            structured_text += f"**{display_name}:**\n"
-                                            for item in field_value:
-                                                structured_text += f"• {item}\n"
-                                            structured_text += "\n"
-                                        elif isinstance(field_value, dict):
-                                            structured_text += f"**{display_name}:**\n"
-                                            for key, value in field_value.items():
-                                                structured_text += f"• {key}: {value}\n"
-                                            structured_text += "\n"
-                                        else:
-                                            structured_text += f"**{display_name}:**\n{field_value}\n\n"
-                                st.session_state['structured_description'] = structured_text
-                            else:
-                                st.session_state['gpt_resp'] = f"❌ Ошибка парсинга. Исходный ответ:\n\n{gpt_text}"
-                                st.session_state['structured_description'] = "Не удалось сформировать структурированное описание"
+                        run_token_budget = int(token_budget) if chunk_selection else None
+                        extraction = extract_description(
+                            model,
+                            sys_prompt,
+                            user_prompt,
+                            desc,
+                            st.session_state['custom_fields'],
+                            st.session_state['model_generator'],
+                            token_budget=run_token_budget
+                        )
+                        gpt_text = extraction['gpt_text']
+                        st.session_state['context_info'] = extraction['context']
+                        st.session_state['yandex_time'] = extraction['elapsed']
+                        if extraction['parse_error']:
+                            st.session_state['gpt_resp'] = f"❌ Ошибка парсинга. Исходный ответ:\n\n{gpt_text}"
+                            st.session_state['structured_description'] = "Не удалось сформировать структурированное описание"
                         else:
-                            start_time = time.perf_counter()
-                            result = model.configure(temperature=1).run([
-                                {"role": "system", "text": sys_prompt},
-                                {"role": "user", "text": user_prompt_filled}
-                            ])
-                            elapsed = time.perf_counter() - start_time
-                            st.session_state['yandex_time'] = elapsed
-                            gpt_text = result[0].text if result and hasattr(result[0], 'text') else str(result)
+                            if extraction['parsed_result']:
+                                st.session_state['parsed_result'] = extraction['parsed_result']
                             st.session_state['gpt_resp'] = gpt_text
-                            st.session_state['structured_description'] = gpt_text
+                            st.session_state['structured_description'] = extraction['structured_text']
+                            # Сохраняем под сайтом, для которого получен markdown, а не под текущим вводом
+                            save_result(
+                                jina_site,
+                                extraction['result_data'],
+                                gpt_text,
+                                extraction['structured_text'],
+                                run_token_budget,
+                                prompt_fingerprint(sys_prompt, user_prompt)
+                            )
                     except Exception as e:
                         st.session_state['gpt_resp'] = f"Ошибка YandexGPT: {e}"
                 if error_msg:
                     st.session_state['gpt_resp'] = error_msg
+                elif st.session_state.get('context_info'):
+                    # Счетчик токенов выше уже отрисован по всей странице — обновляем его по выбранному контексту
+                    st.rerun()
 
         # --- Вторая секция: Выводы ---
         # Структурированное описание (text_area), затем collapsible raw output
@@ -491,6 +504,21 @@ def main():
                         color='orange',
                         icon=":material/link:"
                     )
+            with badge_cols[2]:
+                stored_result_at = st.session_state.get('stored_result_at')
+                if stored_result_at:
+                    st.badge(
+                        f"Из хранилища: {stored_result_at[:19].replace('T', ' ')}",
+                        color='blue',
+                        icon=":material/database:"
+                    )
+
+            context_info = st.session_state.get('context_info')
+            if context_info:
+                st.caption(
+                    f"Фрагментов в промпте: {context_info['selected']} из {context_info['total']} "
+                    f"(~{context_info['tokens']} токен(ов))"
+                )
 
             with st.expander('Ответ от YandexGPT (JSON)', expanded=False):
                 st.code(
@@ -498,5 +526,35 @@ def main():
                     language='json',
                 )
 
+            with st.expander('Сохраненные результаты', expanded=False):
+                results_store = st.session_state['results_store']
+                only_current_schema = st.checkbox('Только текущая схема полей', value=True, key='stored_current_schema')
+                filters = {'latest_only': True}
+                if only_current_schema:
+                    filters['schema_fp'] = schema_fingerprint(st.session_state['custom_fields'])
+                stored_rows = results_store.export_rows(**filters)
+                if stored_rows:
+                    stored_df = pd.DataFrame(stored_rows)
+                    st.dataframe(stored_df, use_container_width=True, hide_index=True)
+                    scol_csv, scol_json = st.columns(2)
+                    with scol_csv:
+                        st.download_button(
+                            label="Скачать CSV",
+                            data=stored_df.to_csv(index=False).encode('utf-8'),
+                            file_name="results.csv",
+                            mime="text/csv",
+                            use_container_width=True
+                        )
+                    with scol_json:
+                        st.download_button(
+                            label="Скачать JSON",
+                            data=results_store.export_json(**filters),
+                            file_name="results.json",
+                            mime="application/json",
+                            use_container_width=True
+                        )
+                else:
+                    st.caption('Сохраненных результатов пока нет')
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,203 @@
+from typing import Dict, List, Any, Optional, Tuple
+import re
+import time
+
+import requests
+
+from dynamic_models import DynamicModelGenerator
+from chunk_selection import select_relevant_chunks
+
+
+JINA_READER_URL = "https://r.jina.ai/"
+JINA_HEADERS = {
+    "Content-Type": "application/json",
+    "X-Engine": "direct",
+    "X-Md-Link-Style": "referenced",
+    "X-Retain-Images": "none",
+    "X-With-Links-Summary": "all"
+}
+LINKS_PHRASE = 'Links/Buttons:'
+
+# --- Промпты по умолчанию ---
+DEFAULT_SYSTEM_PROMPT = "Ты — эксперт по анализу компаний и извлечению структурированной информации. Твоя задача - проанализировать информацию о компании и заполнить все необходимые поля в JSON формате согласно заданной схеме."
+DEFAULT_USER_PROMPT = """Проанализируй информацию о компании и заполни все поля согласно схеме.
+
+        Информация о компании:
+        {desc}
+
+        ВАЖНО:
+        1. Заполни ВСЕ обязательные поля (required: true)
+        2. Для опциональных полей используй null если информация недоступна
+        3. Используй точные данные из текста
+        4. Для числовых полей используй только числа (без текста)
+        5. Для булевых полей используй true/false
+        6. Для списков используй массив: [\"item1\", \"item2\"], либо пустой массив [].
+        7. Для словарей используй объект: {{\"key\": \"value\"}}
+
+        Отвечай ТОЛЬКО JSON объектом с данными. Придерживайся схемы данных, даже если какое-то значение не найдено."""
+
+
+# --- Функция для поиска "О компании" страниц ---
+def find_about_links(md_links_section):
+    # Ищем строки вида: - [caption](url)
+    pattern = re.compile(r'- \[(.*?)\]\((.*?)\)', re.IGNORECASE)
+    about_keywords = [
+        'о компании', 'о нас', 'about', 'about us', 'about-company', 'aboutus', 'about_company', 'aboutus', 'about.html', 'about.php', 'about.aspx', 'aboutus.html', 'aboutus.php', 'aboutus.aspx'
+    ]
+    results = []
+    for match in pattern.finditer(md_links_section):
+        caption, url = match.group(1).strip().lower(), match.group(2).strip().lower()
+        if any(kw in caption for kw in about_keywords) or any(kw in url for kw in about_keywords):
+            results.append({'caption': match.group(1), 'url': match.group(2)})
+    return results
+
+
+def split_links_section(md_text: str) -> Tuple[str, str]:
+    """Разделяет markdown от Jina на основной текст и секцию Links/Buttons"""
+    if LINKS_PHRASE in md_text:
+        content, links = md_text.split(LINKS_PHRASE, 1)
+        return content, links
+    return md_text, ''
+
+
+def fetch_markdown(
+    site: str,
+    find_about: bool = False,
+    reader_url: str = JINA_READER_URL,
+    timeout: float = 10,
+    session: Optional[requests.Session] = None
+) -> Tuple[str, float, bool]:
+    """Получает markdown сайта через Jina Reader; возвращает (markdown, время, найдена ли страница "О компании")"""
+    http = session or requests
+    start_time = time.perf_counter()
+    resp = http.post(reader_url, headers=JINA_HEADERS, json={"url": site}, timeout=timeout)
+    resp.raise_for_status()
+    md_text = resp.text
+    elapsed = time.perf_counter() - start_time
+
+    about_found = False
+    # --- Check for about page if requested ---
+    if find_about:
+        about_links = find_about_links(split_links_section(md_text)[1])
+        if about_links:
+            # Fetch about page markdown
+            about_start = time.perf_counter()
+            about_resp = http.post(reader_url, headers=JINA_HEADERS, json={"url": about_links[0]['url']}, timeout=timeout)
+            about_resp.raise_for_status()
+            md_text = about_resp.text
+            elapsed = time.perf_counter() - about_start  # Optionally, use about page timing
+            about_found = True
+
+    return md_text, elapsed, about_found
+
+
+def build_structured_prompt(
+    user_prompt_filled: str,
+    custom_fields: List[Dict[str, Any]],
+    model_generator: DynamicModelGenerator
+) -> Tuple[str, type]:
+    """Дополняет пользовательский промпт описанием полей и инструкциями по формату; возвращает (промпт, класс модели)"""
+    model_class = model_generator.create_dynamic_model(custom_fields, "DynamicCompanyDescription")
+    parser = model_generator.create_parser(model_class)
+    format_instructions = parser.get_format_instructions()
+    field_instructions = "\n\nПроанализируй информацию о компании и заполни следующие поля в JSON формате:\n"
+    for field in custom_fields:
+        if field.get('description'):
+            field_instructions += f"- {field['name']}: {field['description']}\n"
+        else:
+            field_instructions += f"- {field['name']}\n"
+    enhanced_prompt = f"{user_prompt_filled}\n{field_instructions}\n\n{format_instructions}"
+    return enhanced_prompt, model_class
+
+
+def format_structured_description(result_data: Dict[str, Any], custom_fields: List[Dict[str, Any]]) -> str:
+    """Форматирует извлеченные поля в markdown для отображения"""
+    structured_text = ""
+    for field_name, field_value in result_data.items():
+        if field_value is not None and field_value != "":
+            field_config = next((field for field in custom_fields if field['name'] == field_name), None)
+            display_name = field_config['description'] if field_config else field_name.replace('_', ' ').title()
+            if isinstance(field_value, list):
+                structured_text += f"**{display_name}:**\n"
+                for item in field_value:
+                    structured_text += f"• {item}\n"
+                structured_text += "\n"
+            elif isinstance(field_value, dict):
+                structured_text += f"**{display_name}:**\n"
+                for key, value in field_value.items():
+                    structured_text += f"• {key}: {value}\n"
+                structured_text += "\n"
+            else:
+                structured_text += f"**{display_name}:**\n{field_value}\n\n"
+    return structured_text
+
+
+def extract_description(
+    model,
+    sys_prompt: str,
+    user_prompt: str,
+    desc: str,
+    custom_fields: List[Dict[str, Any]],
+    model_generator: DynamicModelGenerator,
+    token_budget: Optional[int] = None
+) -> Dict[str, Any]:
+    """Запускает YandexGPT по описанию сайта и разбирает ответ.
+
+    Если задан token_budget, в промпт попадают только наиболее релевантные
+    полям фрагменты страницы в пределах бюджета.
+
+    Возвращает словарь с ключами gpt_text, parsed_result, result_data,
+    structured_text, elapsed, parse_error и context.
+    """
+    context = None
+    if token_budget and custom_fields:
+        context = select_relevant_chunks(split_links_section(desc)[0], custom_fields, token_budget)
+        desc = context["text"]
+    user_prompt_filled = user_prompt.replace('{desc}', desc)
+    if custom_fields:
+        enhanced_prompt, model_class = build_structured_prompt(user_prompt_filled, custom_fields, model_generator)
+        start_time = time.perf_counter()
+        result = model.configure(temperature=0.7).run([
+            {"role": "system", "text": sys_prompt},
+            {"role": "user", "text": enhanced_prompt}
+        ])
+        elapsed = time.perf_counter() - start_time
+        gpt_text = result[0].text if result and hasattr(result[0], 'text') else str(result)
+        parsed_result = model_generator.parse_llm_response(gpt_text, model_class)
+        if not parsed_result:
+            return {
+                "gpt_text": gpt_text,
+                "parsed_result": None,
+                "result_data": None,
+                "structured_text": "",
+                "elapsed": elapsed,
+                "parse_error": True,
+                "context": context
+            }
+        result_data = parsed_result.model_dump()
+        return {
+            "gpt_text": gpt_text,
+            "parsed_result": parsed_result,
+            "result_data": result_data,
+            "structured_text": format_structured_description(result_data, custom_fields),
+            "elapsed": elapsed,
+            "parse_error": False,
+            "context": context
+        }
+
+    start_time = time.perf_counter()
+    result = model.configure(temperature=1).run([
+        {"role": "system", "text": sys_prompt},
+        {"role": "user", "text": user_prompt_filled}
+    ])
+    elapsed = time.perf_counter() - start_time
+    gpt_text = result[0].text if result and hasattr(result[0], 'text') else str(result)
+    return {
+        "gpt_text": gpt_text,
+        "parsed_result": None,
+        "result_data": None,
+        "structured_text": gpt_text,
+        "elapsed": elapsed,
+        "parse_error": False,
+        "context": context
+    }
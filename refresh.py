@@ -0,0 +1,294 @@
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import requests
+
+from dynamic_models import DynamicModelGenerator, FieldConfigManager
+from pipeline import DEFAULT_SYSTEM_PROMPT, DEFAULT_USER_PROMPT, split_links_section, fetch_markdown, extract_description
+from results_store import ResultsStore, canonical_site, schema_fingerprint, prompt_fingerprint
+
+
+# --- Нормализация содержимого страницы ---
+MONTHS = (
+    'января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря|'
+    'january|february|march|april|may|june|july|august|september|october|november|december|'
+    'jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec'
+)
+COUNTER_WORDS = (
+    r'просмотр\w*|посетител\w*|посещени\w*|онлайн|комментари\w*|отзыв\w*|лайк\w*|'
+    r'views?|visitors?|visits?|online|comments?|likes?|reviews?'
+)
+TIMESTAMP_WORDS = (
+    r'published|updated|last updated|modified|today|yesterday|'
+    r'опубликовано|обновлено|обновлен|изменено|сегодня|вчера'
+)
+# Время суток, стоящее после даты: "01.05.2024 10:00", "1 мая 2024, в 10:00"
+TIME_AFTER_DATE = r'(?:,?\s+(?:в\s+|at\s+)?\d{1,2}:\d{2}(?::\d{2})?\b)?'
+# Число с разделением разрядов пробелом: 1 234 567
+COUNTER_NUMBER = r'(?:\b\d{1,3}(?:[ \u00a0]\d{3})*\b|\b\d+\b)'
+NOISE_PATTERNS = [
+    # Служебные строки Jina Reader, меняющиеся от запроса к запросу
+    re.compile(r'^published time:.*$', re.IGNORECASE | re.MULTILINE),
+    # Даты и время: 2024-05-01T10:00:00Z, 01.05.2024 10:00, 1 мая 2024, "обновлено сегодня в 10:00".
+    # Время без даты или метки публикации (например, режим работы 9:00-18:00) считается содержимым
+    re.compile(r'\b\d{4}-\d{2}-\d{2}(?:[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:z|[+-]\d{2}:?\d{2})?)?', re.IGNORECASE),
+    re.compile(rf'\b\d{{1,2}}[./]\d{{1,2}}[./]\d{{2,4}}\b{TIME_AFTER_DATE}', re.IGNORECASE),
+    re.compile(rf'\b\d{{1,2}}\s+(?:{MONTHS})\b\.?(?:\s+\d{{4}})?{TIME_AFTER_DATE}', re.IGNORECASE),
+    re.compile(rf'\b(?:{TIMESTAMP_WORDS})\b\s*[:,]?\s*(?:в\s+|at\s+)?\d{{1,2}}:\d{{2}}(?::\d{{2}})?\b', re.IGNORECASE),
+    # Счетчики: "Просмотров: 1 234", "1234 views"
+    re.compile(rf'\b(?:{COUNTER_WORDS})\b\s*[:\-]?\s*{COUNTER_NUMBER}', re.IGNORECASE),
+    re.compile(rf'{COUNTER_NUMBER}\s*(?:{COUNTER_WORDS})\b', re.IGNORECASE),
+    # Год в копирайте: "© 2008-2024"
+    re.compile(r'©\s*\d{4}(?:\s*[-–—]\s*\d{4})?'),
+    # Параметры сброса кэша в ссылках: ?v=123, &_=1700000000
+    re.compile(r'([?&])(?:v|ver|version|_|t|ts|cb|rnd|rand|timestamp)=[\w.-]+', re.IGNORECASE),
+]
+
+
+def normalize_content(md_text: str) -> str:
+    """Нормализует markdown страницы: без секции ссылок, дат, времени, счетчиков и лишних пробелов"""
+    content = split_links_section(md_text or '')[0]
+    for pattern in NOISE_PATTERNS:
+        content = pattern.sub(' ', content)
+    return re.sub(r'\s+', ' ', content).strip().lower()
+
+
+def content_fingerprint(md_text: str) -> str:
+    """Возвращает отпечаток нормализованного содержимого страницы"""
+    return hashlib.sha256(normalize_content(md_text).encode('utf-8')).hexdigest()
+
+
+# --- Условные запросы к сайту ---
+def conditional_probe(
+    site: str,
+    state: Optional[Dict[str, Any]],
+    session: Optional[requests.Session] = None,
+    timeout: float = 10
+) -> Tuple[bool, Optional[str], Optional[str]]:
+    """Отправляет условный HEAD запрос на сайт; возвращает (не изменен, ETag, Last-Modified).
+
+    Ошибки сети и отказ сервера от HEAD не считаются изменением — в этом
+    случае решение принимается по отпечатку содержимого, а прежние валидаторы
+    сохраняются. Они заменяются только новыми значениями из успешного ответа.
+    """
+    http = session or requests
+    url = site if '://' in site else f"http://{site}"
+    etag = state.get('etag') if state else None
+    last_modified = state.get('last_modified') if state else None
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    try:
+        resp = http.head(url, headers=headers, allow_redirects=True, timeout=timeout)
+    except requests.RequestException:
+        return False, etag, last_modified
+    if resp.status_code == 304:
+        return True, etag, last_modified
+    if resp.status_code >= 400:
+        return False, etag, last_modified
+    return False, resp.headers.get('ETag') or etag, resp.headers.get('Last-Modified') or last_modified
+
+
+# --- Инкрементальное обновление ---
+MIN_CHECK_INTERVAL = timedelta(hours=1)
+MAX_CHECK_INTERVAL = timedelta(days=7)
+
+
+def next_check_due(state: Dict[str, Any]) -> datetime:
+    """Время следующей проверки: интервал растет с временем без изменений (половина его, от часа до недели)"""
+    last_checked = datetime.fromisoformat(state['last_checked_at'])
+    stable_for = last_checked - datetime.fromisoformat(state['last_changed_at'])
+    interval = min(max(stable_for / 2, MIN_CHECK_INTERVAL), MAX_CHECK_INTERVAL)
+    return last_checked + interval
+
+
+def plan_refresh(
+    sites: List[str],
+    store: ResultsStore,
+    limit: Optional[int] = None,
+    check_all: bool = False,
+    now: Optional[datetime] = None
+) -> List[str]:
+    """Отбирает сайты для обновления: сначала новые, затем по времени следующей проверки.
+
+    Сайты, для которых время проверки еще не наступило, пропускаются (кроме
+    check_all), поэтому число запросов к Jina растет с числом сайтов к проверке,
+    а не с размером каталога. Время проверки сдвигается после каждой проверки,
+    поэтому при ограничении --limit сайты обходятся по кругу. Дубликаты
+    отбрасываются по каноническому виду адреса.
+    """
+    now = now or datetime.now(timezone.utc)
+    states = store.list_page_states()
+    unique_sites: Dict[str, str] = {}
+    for site in sites:
+        key = canonical_site(site)
+        if key:
+            unique_sites.setdefault(key, site)
+
+    planned = []
+    for key, site in unique_sites.items():
+        state = states.get(key)
+        if state is None:
+            planned.append(((0, ''), site))
+            continue
+        due = next_check_due(state)
+        if check_all or due <= now:
+            planned.append(((1, due.isoformat()), site))
+
+    ordered = [site for _, site in sorted(planned, key=lambda item: item[0])]
+    return ordered[:limit] if limit else ordered
+
+
+def refresh_site(
+    site: str,
+    store: ResultsStore,
+    model,
+    fields_config: List[Dict[str, Any]],
+    model_generator: DynamicModelGenerator,
+    sys_prompt: str = DEFAULT_SYSTEM_PROMPT,
+    user_prompt: str = DEFAULT_USER_PROMPT,
+    model_name: Optional[str] = None,
+    find_about: bool = False,
+    session: Optional[requests.Session] = None,
+    force: bool = False,
+    token_budget: Optional[int] = None
+) -> str:
+    """Обновляет описание одного сайта, пропуская LLM, если содержимое не изменилось.
+
+    Возвращает статус: not_modified (сайт ответил 304), unchanged (отпечаток
+    не изменился), updated (описание пересчитано) или parse_error.
+    """
+    state = store.get_page_state(site)
+    # Результат годится, только если та же модель получила тот же вход: схему, промпты и бюджет фрагментов
+    prompt_fp = prompt_fingerprint(sys_prompt, user_prompt)
+    latest = store.get_latest(
+        site, schema_fingerprint(fields_config), token_budget=token_budget, prompt_fp=prompt_fp, model=model_name
+    )
+    # Результат актуален, если он получен для последней известной версии страницы
+    result_current = bool(
+        latest and state and latest.get('fingerprint') and latest['fingerprint'] == state['fingerprint']
+    )
+
+    etag, last_modified = None, None
+    if state is None or state.get('etag') or state.get('last_modified'):
+        not_modified, etag, last_modified = conditional_probe(site, state, session)
+        # Страница "О компании" может меняться независимо от главной, поэтому 304 учитываем только без нее
+        if not_modified and result_current and not find_about and not force:
+            store.record_check(site)
+            return 'not_modified'
+
+    md_text, fetch_time, _ = fetch_markdown(site, find_about=find_about, session=session)
+    fingerprint = content_fingerprint(md_text)
+    store.record_check(site, fingerprint, etag, last_modified)
+    if latest and latest.get('fingerprint') == fingerprint and not force:
+        return 'unchanged'
+
+    extraction = extract_description(
+        model, sys_prompt, user_prompt, md_text, fields_config, model_generator, token_budget=token_budget
+    )
+    if extraction['parse_error']:
+        return 'parse_error'
+    store.save_result(
+        url=site,
+        markdown=md_text,
+        fields_config=fields_config,
+        result=extraction['result_data'],
+        raw_response=extraction['gpt_text'],
+        structured_description=extraction['structured_text'],
+        model=model_name,
+        fetch_time=fetch_time,
+        llm_time=extraction['elapsed'],
+        fingerprint=fingerprint,
+        token_budget=token_budget,
+        prompt_fp=prompt_fp
+    )
+    return 'updated'
+
+
+def refresh_catalog(
+    sites: List[str],
+    store: ResultsStore,
+    model,
+    fields_config: List[Dict[str, Any]],
+    limit: Optional[int] = None,
+    check_all: bool = False,
+    **kwargs
+) -> Dict[str, int]:
+    """Инкрементально обновляет каталог (только сайты, которым пора на проверку) и возвращает счетчики статусов"""
+    model_generator = DynamicModelGenerator()
+    session = requests.Session()
+    stats: Dict[str, int] = {}
+    for site in plan_refresh(sites, store, limit, check_all=check_all):
+        try:
+            status = refresh_site(site, store, model, fields_config, model_generator, session=session, **kwargs)
+        except Exception as e:
+            print(f"{site}: ошибка: {e}")
+            status = 'error'
+        else:
+            print(f"{site}: {status}")
+        stats[status] = stats.get(status, 0) + 1
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Инкрементальное обновление описаний каталога")
+    parser.add_argument("--csv", default="df_Company.csv", help="CSV каталога с колонкой Site")
+    parser.add_argument("--db", default="results.db", help="Путь к базе результатов")
+    parser.add_argument("--fields", help="JSON конфигурация полей (экспорт из интерфейса); по умолчанию стандартные поля")
+    parser.add_argument("--limit", type=int, help="Максимум сайтов за один запуск")
+    parser.add_argument("--find-about", action="store_true", help="Искать страницу \"О компании\"")
+    parser.add_argument("--force", action="store_true", help="Пересчитать описания даже без изменений (проверяет все сайты)")
+    parser.add_argument("--all", action="store_true", help="Проверить все сайты, даже если время проверки не наступило")
+    parser.add_argument("--token-budget", type=int, help="Бюджет токенов для отбора релевантных фрагментов страницы")
+    parser.add_argument("--model", default="yandexgpt-lite")
+    args = parser.parse_args(argv)
+
+    iam_token = os.environ.get("YC_IAM_TOKEN")
+    if not iam_token:
+        print("Задайте токен YandexGPT в переменной окружения YC_IAM_TOKEN")
+        return 2
+    from yandex_cloud_ml_sdk import YCloudML
+    from yandex_cloud_ml_sdk.auth import IAMTokenAuth
+    import pandas as pd
+
+    sdk = YCloudML(folder_id=os.environ.get("YC_FOLDER_ID", "b1g1u3uo289nf62q3n08").strip(), auth=IAMTokenAuth(iam_token.strip()))
+    model = sdk.models.completions(args.model)
+
+    if args.fields:
+        with open(args.fields, encoding="utf-8") as f:
+            fields_config = json.load(f)
+    else:
+        fields_config = FieldConfigManager().default_fields
+
+    df = pd.read_csv(args.csv)
+    sites = df['Site'].dropna().astype(str).tolist()
+    start = time.perf_counter()
+    stats = refresh_catalog(
+        sites,
+        ResultsStore(args.db),
+        model,
+        fields_config,
+        limit=args.limit,
+        check_all=args.all or args.force,
+        model_name=args.model,
+        find_about=args.find_about,
+        force=args.force,
+        token_budget=args.token_budget
+    )
+    elapsed = time.perf_counter() - start
+    summary = ", ".join(f"{status}: {count}" for status, count in sorted(stats.items()))
+    print(f"\nГотово за {elapsed:.1f}s — {summary}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
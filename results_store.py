@@ -0,0 +1,336 @@
+from typing import Dict, List, Any, Iterator, Optional
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import hashlib
+import json
+import sqlite3
+
+
+def canonical_site(url: str) -> str:
+    """Приводит URL сайта к каноническому виду: без схемы, www, порта по умолчанию и завершающего слеша"""
+    url = (url or '').strip()
+    if not url:
+        return ''
+    if '://' not in url:
+        url = f"http://{url}"
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip('/')
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    return f"{host}{path}"
+
+
+def content_hash(text: str) -> str:
+    """Возвращает SHA-256 хэш содержимого страницы"""
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+
+def schema_fingerprint(fields_config: List[Dict[str, Any]]) -> str:
+    """Возвращает отпечаток схемы полей (имя, тип и описание каждого поля с учетом порядка)"""
+    normalized = [
+        {
+            "name": field.get("name", ""),
+            "type": field.get("type", ""),
+            "description": field.get("description", "") or ""
+        }
+        for field in fields_config
+    ]
+    payload = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def prompt_fingerprint(sys_prompt: str, user_prompt: str) -> str:
+    """Возвращает отпечаток системного и пользовательского промптов"""
+    payload = json.dumps([sys_prompt or '', user_prompt or ''], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+# Значение по умолчанию для необязательных фильтров: "не фильтровать" (None означает "без бюджета")
+ANY = object()
+
+
+class ResultsStore:
+    """Встроенное хранилище результатов извлечения на SQLite"""
+
+    def __init__(self, db_path: str = "results.db"):
+        self.db_path = db_path
+        self._init_db()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Открывает соединение на одну транзакцию и закрывает его по завершении"""
+        # Отдельное соединение на каждую операцию: Streamlit выполняет сессии в разных потоках
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        """Создает таблицы и индексы, если их еще нет"""
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    content_hash TEXT PRIMARY KEY,
+                    markdown TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    site TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    content_hash TEXT NOT NULL REFERENCES pages(content_hash),
+                    fingerprint TEXT,
+                    schema_fingerprint TEXT NOT NULL,
+                    token_budget INTEGER,
+                    prompt_fingerprint TEXT,
+                    fields_config TEXT NOT NULL,
+                    model TEXT,
+                    fetch_time REAL,
+                    llm_time REAL,
+                    result_json TEXT,
+                    raw_response TEXT,
+                    structured_description TEXT,
+                    created_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_results_site_schema
+                    ON results (site, schema_fingerprint, created_at);
+                CREATE INDEX IF NOT EXISTS idx_results_content
+                    ON results (content_hash);
+                CREATE TABLE IF NOT EXISTS page_state (
+                    site TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    fingerprint TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    first_seen_at TEXT NOT NULL,
+                    last_checked_at TEXT NOT NULL,
+                    last_changed_at TEXT NOT NULL
+                );
+            """)
+            # Базы, созданные до появления этих колонок
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(results)")}
+            for column, column_type in (("fingerprint", "TEXT"), ("token_budget", "INTEGER"), ("prompt_fingerprint", "TEXT")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE results ADD COLUMN {column} {column_type}")
+
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Преобразует строку результата в словарь с разобранными JSON полями"""
+        item = dict(row)
+        item["fields_config"] = json.loads(item["fields_config"]) if item.get("fields_config") else []
+        item["result"] = json.loads(item.pop("result_json")) if item.get("result_json") else None
+        return item
+
+    def save_result(
+        self,
+        url: str,
+        markdown: str,
+        fields_config: List[Dict[str, Any]],
+        result: Optional[Dict[str, Any]],
+        raw_response: str = '',
+        structured_description: str = '',
+        model: Optional[str] = None,
+        fetch_time: Optional[float] = None,
+        llm_time: Optional[float] = None,
+        fingerprint: Optional[str] = None,
+        token_budget: Optional[int] = None,
+        prompt_fp: Optional[str] = None
+    ) -> int:
+        """Сохраняет результат извлечения и возвращает его идентификатор.
+
+        token_budget и prompt_fp описывают вход модели: бюджет отбора фрагментов
+        (None — вся страница) и отпечаток промптов.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        page_hash = content_hash(markdown)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO pages (content_hash, markdown, created_at) VALUES (?, ?, ?)",
+                (page_hash, markdown, now)
+            )
+            cursor = conn.execute(
+                """
+                INSERT INTO results (
+                    site, url, content_hash, fingerprint, schema_fingerprint, token_budget, prompt_fingerprint,
+                    fields_config, model, fetch_time, llm_time, result_json, raw_response, structured_description,
+                    created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    canonical_site(url),
+                    url,
+                    page_hash,
+                    fingerprint,
+                    schema_fingerprint(fields_config),
+                    token_budget,
+                    prompt_fp,
+                    json.dumps(fields_config, ensure_ascii=False),
+                    model,
+                    fetch_time,
+                    llm_time,
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    raw_response,
+                    structured_description,
+                    now
+                )
+            )
+            return cursor.lastrowid
+
+    def get_latest(
+        self,
+        site: str,
+        schema_fp: str,
+        token_budget: Any = ANY,
+        prompt_fp: Any = ANY,
+        model: Any = ANY
+    ) -> Optional[Dict[str, Any]]:
+        """Возвращает последний результат для сайта под заданной схемой (вместе с markdown страницы).
+
+        Если заданы token_budget (None — вся страница), prompt_fp или model,
+        результат должен быть получен с тем же бюджетом фрагментов, теми же
+        промптами и той же моделью.
+        """
+        query = """
+            SELECT r.*, p.markdown
+            FROM results r JOIN pages p ON p.content_hash = r.content_hash
+            WHERE r.site = ? AND r.schema_fingerprint = ?
+        """
+        params: List[Any] = [canonical_site(site), schema_fp]
+        if token_budget is not ANY:
+            query += " AND r.token_budget IS ?"
+            params.append(token_budget)
+        if prompt_fp is not ANY:
+            query += " AND r.prompt_fingerprint IS ?"
+            params.append(prompt_fp)
+        if model is not ANY:
+            query += " AND r.model IS ?"
+            params.append(model)
+        query += " ORDER BY r.created_at DESC, r.id DESC LIMIT 1"
+        with self._connect() as conn:
+            row = conn.execute(query, params).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list_results(
+        self,
+        site: Optional[str] = None,
+        schema_fp: Optional[str] = None,
+        latest_only: bool = False,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Возвращает список результатов (новые первыми) с необязательной фильтрацией"""
+        conditions = []
+        params: List[Any] = []
+        if site:
+            conditions.append("r.site = ?")
+            params.append(canonical_site(site))
+        if schema_fp:
+            conditions.append("r.schema_fingerprint = ?")
+            params.append(schema_fp)
+        if latest_only:
+            # Только последний результат для каждого варианта (сайт, схема, бюджет, промпты, модель)
+            conditions.append("""
+                r.id = (
+                    SELECT r2.id FROM results r2
+                    WHERE r2.site = r.site AND r2.schema_fingerprint = r.schema_fingerprint
+                        AND r2.token_budget IS r.token_budget AND r2.prompt_fingerprint IS r.prompt_fingerprint
+                        AND r2.model IS r.model
+                    ORDER BY r2.created_at DESC, r2.id DESC
+                    LIMIT 1
+                )
+            """)
+        query = "SELECT r.* FROM results r"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY r.created_at DESC, r.id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def export_json(self, **filters) -> str:
+        """Экспортирует результаты в JSON строку"""
+        return json.dumps(self.list_results(**filters), ensure_ascii=False, indent=2)
+
+    def export_rows(self, **filters) -> List[Dict[str, Any]]:
+        """Возвращает плоские строки для табличного экспорта (поля результата разворачиваются в колонки)"""
+        rows = []
+        for item in self.list_results(**filters):
+            row = {
+                "site": item["site"],
+                "url": item["url"],
+                "schema_fingerprint": item["schema_fingerprint"],
+                "token_budget": item["token_budget"],
+                "prompt_fingerprint": item["prompt_fingerprint"],
+                "content_hash": item["content_hash"],
+                "model": item["model"],
+                "fetch_time": item["fetch_time"],
+                "llm_time": item["llm_time"],
+                "created_at": item["created_at"]
+            }
+            for key, value in (item["result"] or {}).items():
+                row[key] = json.dumps(value, ensure_ascii=False) if isinstance(value, (list, dict)) else value
+            rows.append(row)
+        return rows
+
+    def get_page_state(self, site: str) -> Optional[Dict[str, Any]]:
+        """Возвращает состояние страницы сайта (отпечаток, валидаторы HTTP, время проверки и изменения)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM page_state WHERE site = ?", (canonical_site(site),)).fetchone()
+        return dict(row) if row else None
+
+    def list_page_states(self) -> Dict[str, Dict[str, Any]]:
+        """Возвращает состояния всех известных страниц по каноническому сайту"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM page_state").fetchall()
+        return {row["site"]: dict(row) for row in rows}
+
+    def record_check(
+        self,
+        url: str,
+        fingerprint: Optional[str] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> bool:
+        """Записывает проверку страницы и возвращает True, если содержимое изменилось.
+
+        Без отпечатка (ответ 304) обновляется только время проверки.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        site = canonical_site(url)
+        with self._connect() as conn:
+            row = conn.execute("SELECT fingerprint FROM page_state WHERE site = ?", (site,)).fetchone()
+            if row is None:
+                conn.execute(
+                    """
+                    INSERT INTO page_state (
+                        site, url, fingerprint, etag, last_modified, first_seen_at, last_checked_at, last_changed_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (site, url, fingerprint, etag, last_modified, now, now, now)
+                )
+                return True
+            if fingerprint is None:
+                conn.execute("UPDATE page_state SET last_checked_at = ? WHERE site = ?", (now, site))
+                return False
+            changed = row["fingerprint"] != fingerprint
+            conn.execute(
+                """
+                UPDATE page_state
+                SET url = ?, fingerprint = ?, etag = ?, last_modified = ?, last_checked_at = ?,
+                    last_changed_at = CASE WHEN ? THEN ? ELSE last_changed_at END
+                WHERE site = ?
+                """,
+                (url, fingerprint, etag, last_modified, now, changed, now, site)
+            )
+            return changed
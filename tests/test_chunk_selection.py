@@ -0,0 +1,74 @@
+import numpy as np
+
+from chunk_selection import bm25_scores, estimate_tokens, select_relevant_chunks, split_into_chunks, tokenize
+from dynamic_models import FieldConfigManager
+
+
+FIELDS = FieldConfigManager().default_fields
+FILLER = "Мы ценим доверие клиентов и работаем честно. " * 12
+
+
+def make_page(*sections):
+    return "\n\n".join(sections)
+
+
+def test_bm25_scores_rank_matching_chunk_first():
+    documents = [tokenize(FILLER), tokenize("Контактная информация: телефон и email"), tokenize("Регионы деятельности: Урал")]
+    queries = [tokenize("Контактная информация"), tokenize("Регионы деятельности"), tokenize("отсутствующий термин")]
+    scores = bm25_scores(documents, queries)
+    assert scores.shape == (3, 3)
+    assert np.argmax(scores[0]) == 1
+    assert np.argmax(scores[1]) == 2
+    assert not scores[2].any()
+
+
+def test_split_drops_link_references_and_respects_size():
+    chunks = split_into_chunks(make_page("# Заголовок", FILLER * 3, "[1]: https://example.ru/a"), max_chars=600)
+    assert all(len(chunk) <= 600 for chunk in chunks)
+    assert not any("example.ru" in chunk for chunk in chunks)
+
+
+def test_whole_page_returned_when_it_fits():
+    page = make_page("# Ромашка", "Контактная информация: +7 495 000 00 00")
+    context = select_relevant_chunks(page, FIELDS, token_budget=10000)
+    assert context["selected"] == context["total"]
+    assert "Контактная информация" in context["text"]
+
+
+def test_selection_keeps_field_evidence_within_budget_in_document_order():
+    page = make_page(
+        "# ООО Ромашка", FILLER, FILLER,
+        "## Контакты\nКонтактная информация: +7 495 123 45 67",
+        FILLER,
+        "## Регионы\nРегионы деятельности: Москва, Урал",
+        FILLER
+    )
+    context = select_relevant_chunks(page, FIELDS, token_budget=500)
+    assert context["tokens"] <= 500
+    assert "+7 495 123 45 67" in context["text"]
+    assert context["text"].index("Контакты") < context["text"].index("Регионы")
+
+
+def test_unused_budget_is_filled_when_wording_differs():
+    page = make_page(FILLER * 2, *[f"Работаем в Москве, производим насосы серии {i}. " * 8 for i in range(40)])
+    context = select_relevant_chunks(page, FIELDS, token_budget=2000)
+    assert context["selected"] > 1
+    assert 2000 - max(estimate_tokens(chunk) for chunk in split_into_chunks(page)) < context["tokens"] <= 2000
+
+
+def test_small_budget_never_yields_empty_text():
+    page = make_page(FILLER * 3, FILLER * 3)
+    context = select_relevant_chunks(page, FIELDS, token_budget=20)
+    assert context["text"]
+    assert context["tokens"] <= 20
+
+
+def test_fallback_trim_respects_custom_token_counter():
+    # Счетчик, растущий медленнее длины текста: линейная оценка обрезки превысила бы бюджет
+    def count_tokens(text):
+        return int(len(text) ** 0.5) + 1
+
+    page = make_page(FILLER * 3, FILLER * 3)
+    context = select_relevant_chunks(page, FIELDS, token_budget=10, count_tokens=count_tokens)
+    assert context["text"]
+    assert context["tokens"] == count_tokens(context["text"]) <= 10
@@ -0,0 +1,69 @@
+import argparse
+import random
+
+import pytest
+
+from load_test import compare_with_baseline, config_mismatches, parse_distribution, percentile, request_rng, sample_latency
+
+
+def make_level(concurrency=4, throughput=10.0, p95=1.0, p99=1.2, cpu_ms=20.0):
+    return {"concurrency": concurrency, "throughput": throughput, "p95_s": p95, "p99_s": p99, "cpu_ms_per_job": cpu_ms}
+
+
+def test_parse_distribution():
+    assert parse_distribution("lognormal:0.8,0.4") == ("lognormal", [0.8, 0.4])
+    assert parse_distribution(" Fixed:1 ") == ("fixed", [1.0])
+    for spec in ("gamma:1", "uniform:1", "exp:abc"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_distribution(spec)
+
+
+def test_sample_latency_respects_distribution_bounds():
+    rng = random.Random(1)
+    assert sample_latency(("fixed", [0.5]), rng) == 0.5
+    assert sample_latency(("fixed", [-1.0]), rng) == 0.0
+    assert all(0.2 <= sample_latency(("uniform", [0.2, 0.4]), rng) <= 0.4 for _ in range(100))
+    assert sample_latency(("exp", [0.0]), rng) == 0.0
+    assert sample_latency(("lognormal", [0.0, 0.5]), rng) == 0.0
+    median = sorted(sample_latency(("lognormal", [2.0, 0.5]), rng) for _ in range(2001))[1000]
+    assert 1.8 < median < 2.2
+
+
+def test_request_rng_depends_only_on_seed_and_request():
+    assert request_rng(42, "jina", "a.ru").random() == request_rng(42, "jina", "a.ru").random()
+    assert request_rng(42, "jina", "a.ru").random() != request_rng(42, "llm", "a.ru").random()
+    assert request_rng(42, "jina", "a.ru").random() != request_rng(43, "jina", "a.ru").random()
+
+
+def test_percentile_nearest_rank():
+    values = [5, 1, 4, 2, 3]
+    assert percentile([], 95) is None
+    assert percentile(values, 50) == 3
+    assert percentile(values, 95) == 5
+    assert percentile(values, 0) == 1
+
+
+def test_compare_with_baseline_reports_regressions_beyond_tolerance():
+    baseline = {"levels": [make_level()]}
+    assert compare_with_baseline([make_level(throughput=8.5, p95=1.15, cpu_ms=23.0)], baseline, 0.2) == []
+    regressions = compare_with_baseline([make_level(throughput=7.0, p99=1.5, cpu_ms=30.0)], baseline, 0.2)
+    assert regressions == [
+        "concurrency=4: throughput 7.00 < 10.00",
+        "concurrency=4: p99_s 1.500 > 1.200",
+        "concurrency=4: cpu_ms_per_job 30.000 > 20.000"
+    ]
+    # Уровни, которых нет в эталоне, не сравниваются
+    assert compare_with_baseline([make_level(concurrency=8, throughput=1.0)], baseline, 0.2) == []
+
+
+def test_compare_with_baseline_ignores_deltas_below_noise_floor():
+    baseline = {"levels": [make_level(p95=0.010, p99=0.010, cpu_ms=2.0)]}
+    assert compare_with_baseline([make_level(p95=0.014, p99=0.014, cpu_ms=3.5)], baseline, 0.2) == []
+
+
+def test_config_mismatches():
+    config = {"levels": "1,4", "jina_latency": ("fixed", [0.5]), "token_budget": None, "seed": 42}
+    baseline = {"config": {"levels": "1,2,4", "jina_latency": ["fixed", [0.5]], "token_budget": None, "seed": 42}}
+    assert config_mismatches(config, baseline) == []
+    assert config_mismatches({**config, "token_budget": 1000, "seed": 7}, baseline) == ["token_budget", "seed"]
+    assert config_mismatches(config, {}) == ["jina_latency", "seed"]
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from refresh import conditional_probe, content_fingerprint, normalize_content, plan_refresh
+from results_store import ResultsStore
+
+
+PAGE = (
+    "Title: Ромашка\n\n"
+    "Published Time: 2024-05-01T10:00:00Z\n"
+    "ООО Ромашка, поставки насосов. Просмотров: 1 234. 15 comments.\n"
+    "Новость от 1 мая 2024, в 10:00. Обновлено сегодня в 12:30.\n"
+    "Режим работы: 9:00-18:00. Телефон +7 495 000 00 00.\n"
+    "© 2008-2024\n"
+    "Links/Buttons:\n- [О компании](https://romashka.ru/about?v=1)\n"
+)
+
+
+def test_fingerprint_ignores_timestamps_counters_and_links():
+    noisy = (
+        PAGE.replace("2024-05-01T10:00:00Z", "2025-06-02T11:00:00Z")
+        .replace("1 234", "5 678")
+        .replace("15 comments", "3 comments")
+        .replace("1 мая 2024, в 10:00", "2 июня 2025, в 11:15")
+        .replace("в 12:30", "в 08:05")
+        .replace("2008-2024", "2008-2025")
+        .replace("about?v=1", "contacts")
+    )
+    assert content_fingerprint(PAGE) == content_fingerprint(noisy)
+
+
+def test_fingerprint_detects_content_changes():
+    assert content_fingerprint(PAGE) != content_fingerprint(PAGE.replace("9:00-18:00", "10:00-19:00"))
+    assert content_fingerprint(PAGE) != content_fingerprint(PAGE.replace("000 00 00", "111 11 11"))
+    assert content_fingerprint(PAGE) != content_fingerprint(PAGE.replace("насосов", "клапанов"))
+
+
+def test_normalize_keeps_words_sharing_prefix_with_months_and_counters():
+    assert normalize_content("5 decades, 3 marketplaces, 2 likely cases") == "5 decades, 3 marketplaces, 2 likely cases"
+
+
+def test_plan_refresh_rotates_through_catalog_with_limit(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    sites = [f"site{i}.ru" for i in range(6)]
+    visited = []
+    for _ in range(4):
+        plan = plan_refresh(sites, store, limit=2, check_all=True)
+        visited.append(plan)
+        for site in plan:
+            store.record_check(site, "unchanged")
+    assert [set(plan) for plan in visited[:3]] == [{"site0.ru", "site1.ru"}, {"site2.ru", "site3.ru"}, {"site4.ru", "site5.ru"}]
+    assert set(visited[3]) == {"site0.ru", "site1.ru"}
+
+
+def test_plan_refresh_puts_new_sites_first(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    store.record_check("old.ru", "fp")
+    assert plan_refresh(["old.ru", "new.ru"], store, check_all=True) == ["new.ru", "old.ru"]
+
+
+def test_plan_refresh_skips_sites_not_due(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    store.record_check("old.ru", "fp")
+    assert plan_refresh(["old.ru", "new.ru"], store) == ["new.ru"]
+    later = datetime.now(timezone.utc) + timedelta(hours=2)
+    assert plan_refresh(["old.ru", "new.ru"], store, now=later) == ["new.ru", "old.ru"]
+
+
+def test_plan_refresh_deduplicates_canonical_sites(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    assert plan_refresh(["www.a.ru", "a.ru", "https://a.ru/", "b.ru", ""], store) == ["www.a.ru", "b.ru"]
+
+
+class FakeSession:
+    def __init__(self, status_code=None, headers=None, error=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.error = error
+        self.sent_headers = None
+
+    def head(self, url, headers=None, **kwargs):
+        self.sent_headers = headers
+        if self.error:
+            raise self.error
+        return type("Response", (), {"status_code": self.status_code, "headers": self.headers})()
+
+
+def test_conditional_probe_keeps_validators_on_failure():
+    state = {"etag": '"abc"', "last_modified": "Wed, 01 May 2024 10:00:00 GMT"}
+    assert conditional_probe("a.ru", state, FakeSession(error=requests.ConnectionError())) == (False, '"abc"', state["last_modified"])
+    assert conditional_probe("a.ru", state, FakeSession(status_code=503)) == (False, '"abc"', state["last_modified"])
+
+
+def test_conditional_probe_sends_validators_and_updates_them():
+    state = {"etag": '"abc"', "last_modified": None}
+    session = FakeSession(status_code=304)
+    assert conditional_probe("a.ru", state, session) == (True, '"abc"', None)
+    assert session.sent_headers == {"If-None-Match": '"abc"'}
+    assert conditional_probe("a.ru", state, FakeSession(status_code=200, headers={"ETag": '"def"'})) == (False, '"def"', None)
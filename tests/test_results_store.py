@@ -0,0 +1,98 @@
+import sqlite3
+
+from results_store import ResultsStore, canonical_site, schema_fingerprint
+
+
+FIELDS = [{"name": "company_info", "type": "text", "description": "Описание компании"}]
+
+
+def test_canonical_site_strips_scheme_www_port_and_slash():
+    assert canonical_site("https://www.Romashka.ru/") == "romashka.ru"
+    assert canonical_site("http://romashka.ru:80") == "romashka.ru"
+    assert canonical_site("romashka.ru:8080/about/") == "romashka.ru:8080/about"
+    assert canonical_site("romashka.ru/catalog?page=2") == "romashka.ru/catalog?page=2"
+    assert canonical_site("  ") == ""
+
+
+def test_get_latest_returns_newest_result_with_markdown(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    store.save_result("https://romashka.ru", "старая страница", FIELDS, {"company_info": "старое"})
+    store.save_result("www.romashka.ru/", "новая страница", FIELDS, {"company_info": "новое"})
+    latest = store.get_latest("romashka.ru", schema_fingerprint(FIELDS))
+    assert latest["result"] == {"company_info": "новое"}
+    assert latest["markdown"] == "новая страница"
+    assert store.get_latest("romashka.ru", schema_fingerprint(FIELDS + FIELDS)) is None
+
+
+def test_get_latest_breaks_timestamp_ties_by_id(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    first = store.save_result("a.ru", "md", FIELDS, {"company_info": "1"})
+    second = store.save_result("a.ru", "md", FIELDS, {"company_info": "2"})
+    with sqlite3.connect(store.db_path) as conn:
+        conn.execute("UPDATE results SET created_at = '2024-01-01T00:00:00+00:00' WHERE id IN (?, ?)", (first, second))
+    assert store.get_latest("a.ru", schema_fingerprint(FIELDS))["id"] == second
+
+
+def test_get_latest_filters_budget_and_prompt_only_when_given(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    store.save_result("a.ru", "md", FIELDS, {"company_info": "full"}, prompt_fp="p1")
+    store.save_result("a.ru", "md", FIELDS, {"company_info": "budget"}, token_budget=1000, prompt_fp="p1")
+    schema_fp = schema_fingerprint(FIELDS)
+    assert store.get_latest("a.ru", schema_fp)["result"] == {"company_info": "budget"}
+    assert store.get_latest("a.ru", schema_fp, token_budget=None)["result"] == {"company_info": "full"}
+    assert store.get_latest("a.ru", schema_fp, token_budget=1000, prompt_fp="p1")["result"] == {"company_info": "budget"}
+    assert store.get_latest("a.ru", schema_fp, prompt_fp="p2") is None
+
+
+def test_latest_only_keeps_newest_result_per_variant(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    store.save_result("a.ru", "md", FIELDS, {"company_info": "full 1"})
+    store.save_result("a.ru", "md", FIELDS, {"company_info": "full 2"})
+    store.save_result("a.ru", "md", FIELDS, {"company_info": "budget"}, token_budget=1000)
+    store.save_result("b.ru", "md", FIELDS, {"company_info": "b"})
+    results = store.list_results(latest_only=True)
+    assert [item["result"]["company_info"] for item in results] == ["b", "budget", "full 2"]
+    assert [row["site"] for row in store.export_rows(site="a.ru", latest_only=True)] == ["a.ru", "a.ru"]
+
+
+def test_old_database_is_migrated(tmp_path):
+    db_path = str(tmp_path / "results.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript("""
+            CREATE TABLE pages (content_hash TEXT PRIMARY KEY, markdown TEXT NOT NULL, created_at TEXT NOT NULL);
+            CREATE TABLE results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, site TEXT NOT NULL, url TEXT NOT NULL,
+                content_hash TEXT NOT NULL, schema_fingerprint TEXT NOT NULL, fields_config TEXT NOT NULL,
+                model TEXT, fetch_time REAL, llm_time REAL, result_json TEXT, raw_response TEXT,
+                structured_description TEXT, created_at TEXT NOT NULL
+            );
+        """)
+    store = ResultsStore(db_path)
+    store.save_result("a.ru", "md", FIELDS, {"company_info": "x"}, fingerprint="fp", token_budget=1000, prompt_fp="p")
+    latest = store.get_latest("a.ru", schema_fingerprint(FIELDS), token_budget=1000, prompt_fp="p")
+    assert latest["fingerprint"] == "fp"
+    assert store.export_rows()[0]["prompt_fingerprint"] == "p"
+
+
+def test_record_check_detects_changes(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    assert store.record_check("https://www.a.ru/", "fp1", etag='"1"') is True
+    first = store.get_page_state("a.ru")
+    assert store.record_check("a.ru", "fp1", etag='"1"') is False
+    assert store.get_page_state("a.ru")["last_changed_at"] == first["last_changed_at"]
+    # Ответ 304: меняется только время проверки
+    assert store.record_check("a.ru") is False
+    assert store.get_page_state("a.ru")["fingerprint"] == "fp1"
+    assert store.record_check("a.ru", "fp2") is True
+    state = store.get_page_state("a.ru")
+    assert state["fingerprint"] == "fp2"
+    assert state["last_changed_at"] > first["last_changed_at"]
+    assert list(store.list_page_states()) == ["a.ru"]
+
+
+def test_get_latest_filters_model_when_given(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    store.save_result("a.ru", "md", FIELDS, {"company_info": "lite"}, model="yandexgpt-lite")
+    schema_fp = schema_fingerprint(FIELDS)
+    assert store.get_latest("a.ru", schema_fp, model="yandexgpt-lite")["result"] == {"company_info": "lite"}
+    assert store.get_latest("a.ru", schema_fp, model="yandexgpt") is None